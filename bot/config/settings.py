@@ -1,19 +1,21 @@
 from environs import Env
-from typing import List
+from functools import lru_cache
+from typing import FrozenSet, Iterable
 
 class Config:
     def __init__(self, 
                  bot_token: str,
-                 allowed_user_ids: List[str],
-                 admin_id: str,
+                 allowed_user_ids: Iterable[int],
+                 admin_id: int,
                  openai_api_key: str,
                  groq_api_key: str,
                  anthropic_api_key: str,
                  perplexity_api_key: str,
                  max_tokens: int = 1024):
         self.bot_token = bot_token
-        self.allowed_user_ids = allowed_user_ids
-        self.admin_id = admin_id
+        # Converted once so membership checks are O(1) and need no str() per message
+        self.allowed_user_ids: FrozenSet[int] = frozenset(int(id) for id in allowed_user_ids)
+        self.admin_id = int(admin_id)
         self.openai_api_key = openai_api_key
         self.groq_api_key = groq_api_key
         self.anthropic_api_key = anthropic_api_key
@@ -21,19 +23,21 @@ class Config:
         self.max_tokens = max_tokens
 
     @classmethod
+    @lru_cache(maxsize=None)
     def from_env(cls):
+        """Load config from the environment once; later calls share the same instance"""
         env = Env()
         env.read_env()
         
-        allowed_ids = [id.strip() for id in env.str("ALLOWED_USER_IDS").split(',')]
+        allowed_ids = [id.strip() for id in env.str("ALLOWED_USER_IDS").split(',') if id.strip()]
         
         return cls(
             bot_token=env.str("BOT_TOKEN"),
             allowed_user_ids=allowed_ids,
-            admin_id=env.str("ADMIN_ID"),
+            admin_id=env.int("ADMIN_ID"),
             openai_api_key=env.str("OPENAI_API_KEY"),
             groq_api_key=env.str("GROQ_API_KEY"),
             anthropic_api_key=env.str("ANTHROPIC_API_KEY"),
             perplexity_api_key=env.str("PERPLEXITY_API_KEY"),
             max_tokens=env.int("MAX_TOKENS", 4096)
-        ) 
\ No newline at end of file
+        )
@@ -1,25 +1,46 @@
 from aiogram import Router, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
+from aiogram.types import Message, InlineKeyboardMarkup
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from ..services.storage import Storage
 from ..config import Config
 from ..keyboards import reply as kb
-from ..handlers.user import UserStates
+from ..handlers.user import UserStates, is_admin
 import aiosqlite
+import asyncio
 import logging
 import traceback
+from typing import Tuple
 
 # Create router with name
 router = Router(name='admin_router')
 config = Config.from_env()
 storage = Storage("data/chat.db")
 
+BROADCAST_RATE = 25  # messages per second, under Telegram's ~30/s bulk limit
+
+async def send_broadcast(user_ids, send) -> Tuple[int, int]:
+    """Deliver to all users concurrently, staggered to stay under the rate limit"""
+    async def deliver(user_id: int, delay: float) -> bool:
+        await asyncio.sleep(delay)
+        try:
+            await send(user_id)
+            return True
+        except Exception as e:
+            logging.warning("Failed to send broadcast to user %s: %s", user_id, e)
+            return False
+
+    results = await asyncio.gather(*(
+        deliver(user_id, i / BROADCAST_RATE) for i, user_id in enumerate(user_ids)
+    ))
+    success_count = sum(results)
+    return success_count, len(results) - success_count
+
 # Admin handlers with explicit filters
 @router.message(F.text == "👑 Admin")
 async def admin_panel_button(message: Message, state: FSMContext):
     """Handle admin button press"""
-    if str(message.from_user.id) != config.admin_id:
+    if not is_admin(message.from_user.id):
         return
         
     await state.set_state(UserStates.admin_menu)
@@ -33,7 +54,7 @@ async def admin_panel_button(message: Message, state: FSMContext):
 @router.message(F.text == "🔙 Back")
 async def back_button(message: Message, state: FSMContext):
     """Handle back button press"""
-    if str(message.from_user.id) != config.admin_id:
+    if not is_admin(message.from_user.id):
         return
         
     await state.set_state(UserStates.chatting)
@@ -45,28 +66,25 @@ async def back_button(message: Message, state: FSMContext):
 @router.message(F.text == "📊 Stats", UserStates.admin_menu)
 async def stats_button(message: Message, state: FSMContext):
     """Handle stats button press with detailed statistics"""
-    if str(message.from_user.id) != config.admin_id:
+    if not is_admin(message.from_user.id):
         return
         
     try:
-        async with aiosqlite.connect(storage.db_path) as db:
+        # The queries are independent, so run them side by side on pooled connections
+        total_rows, active_rows, provider_stats, top_users = await asyncio.gather(
             # Get total users
-            async with db.execute("""
+            storage.fetch_all("""
                 SELECT COUNT(*) as total 
                 FROM users
-            """) as cursor:
-                total_users = (await cursor.fetchone())[0]
-            
+            """),
             # Get active users (last 24h)
-            async with db.execute("""
+            storage.fetch_all("""
                 SELECT COUNT(DISTINCT user_id) as active_users
                 FROM users 
                 WHERE datetime(last_activity) > datetime('now', '-1 day')
-            """) as cursor:
-                active_users = (await cursor.fetchone())[0]
-
+            """),
             # Get provider usage stats (30 days)
-            async with db.execute("""
+            storage.fetch_all("""
                 SELECT 
                     provider,
                     COUNT(DISTINCT user_id) as unique_users,
@@ -76,11 +94,9 @@ async def stats_button(message: Message, state: FSMContext):
                 FROM usage_stats 
                 WHERE datetime(timestamp) > datetime('now', '-30 day')
                 GROUP BY provider
-            """) as cursor:
-                provider_stats = await cursor.fetchall()
-
+            """),
             # Get top users (30 days)
-            async with db.execute("""
+            storage.fetch_all("""
                 SELECT 
                     u.user_id,
                     u.username,
@@ -95,8 +111,10 @@ async def stats_button(message: Message, state: FSMContext):
                 GROUP BY u.user_id, u.username, u.first_name
                 ORDER BY total_messages DESC
                 LIMIT 5
-            """) as cursor:
-                top_users = await cursor.fetchall()
+            """)
+        )
+        total_users = total_rows[0][0]
+        active_users = active_rows[0][0]
 
         # Format the response
         response = [
@@ -159,7 +177,7 @@ async def stats_button(message: Message, state: FSMContext):
 @router.message(F.text == "📢 Broadcast")
 async def broadcast_button(message: Message, state: FSMContext):
     """Handle broadcast button press"""
-    if str(message.from_user.id) != config.admin_id:
+    if not is_admin(message.from_user.id):
         return
         
     await state.set_state(UserStates.broadcasting)
@@ -174,7 +192,7 @@ async def broadcast_button(message: Message, state: FSMContext):
 @router.message(UserStates.broadcasting)
 async def handle_broadcast(message: Message, state: FSMContext):
     """Handle messages in broadcast state"""
-    if str(message.from_user.id) != config.admin_id:
+    if not is_admin(message.from_user.id):
         return
 
     if message.text == "🔙 Back" or message.text == "/cancel":
@@ -202,9 +220,7 @@ async def handle_broadcast(message: Message, state: FSMContext):
             return
 
         # Get all allowed users
-        allowed_users = set([config.admin_id] + config.allowed_user_ids)
-        success_count = 0
-        fail_count = 0
+        allowed_users = config.allowed_user_ids | {config.admin_id}
 
         # Send status message
         status_msg = await message.answer(
@@ -212,36 +228,33 @@ async def handle_broadcast(message: Message, state: FSMContext):
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[])
         )
 
-        for user_id in allowed_users:
-            try:
-                if message.photo:
-                    caption = message.caption or ""  # Use empty string if no caption
-                    await message.bot.send_photo(
-                        chat_id=user_id,
-                        photo=message.photo[-1].file_id,
-                        caption=f"📢 <b>Broadcast from Admin:</b>\n\n{caption}",
-                        parse_mode="HTML"
-                    )
-                elif message.video:
-                    caption = message.caption or ""  # Use empty string if no caption
-                    await message.bot.send_video(
+        async def send(user_id: int):
+            if message.photo:
+                caption = message.caption or ""  # Use empty string if no caption
+                await message.bot.send_photo(
+                    chat_id=user_id,
+                    photo=message.photo[-1].file_id,
+                    caption=f"📢 <b>Broadcast from Admin:</b>\n\n{caption}",
+                    parse_mode="HTML"
+                )
+            elif message.video:
+                caption = message.caption or ""  # Use empty string if no caption
+                await message.bot.send_video(
+                    chat_id=user_id,
+                    video=message.video.file_id,
+                    caption=f"📢 <b>Broadcast from Admin:</b>\n\n{caption}",
+                    parse_mode="HTML"
+                )
+            elif message.text:
+                # Only send text messages if there's actual text
+                if message.text.strip():
+                    await message.bot.send_message(
                         chat_id=user_id,
-                        video=message.video.file_id,
-                        caption=f"📢 <b>Broadcast from Admin:</b>\n\n{caption}",
+                        text=f"📢 <b>Broadcast from Admin:</b>\n\n{message.text}",
                         parse_mode="HTML"
                     )
-                elif message.text:
-                    # Only send text messages if there's actual text
-                    if message.text.strip():
-                        await message.bot.send_message(
-                            chat_id=user_id,
-                            text=f"📢 <b>Broadcast from Admin:</b>\n\n{message.text}",
-                            parse_mode="HTML"
-                        )
-                success_count += 1
-            except Exception as e:
-                logging.error(f"Failed to send broadcast to user {user_id}: {str(e)}")
-                fail_count += 1
+
+        success_count, fail_count = await send_broadcast(allowed_users, send)
 
         # Delete status message and show results
         try:
@@ -290,9 +303,10 @@ async def stats_command(message: Message):
     await message.answer(f"Bot Statistics:\nTotal users: {total_users[0]}")
 
 @router.message(Command("broadcast"))
-async def broadcast_command(message: Message):
+async def broadcast_command(message: Message, command: CommandObject):
     """Broadcast message to all users"""
-    broadcast_text = message.text.replace("/broadcast", "").strip()
+    # Command filter already parsed the text (including any @botname suffix)
+    broadcast_text = (command.args or "").strip()
     if not broadcast_text:
         await message.answer("Please provide a message to broadcast")
         return
@@ -301,22 +315,16 @@ async def broadcast_command(message: Message):
         async with db.execute("SELECT user_id FROM users") as cursor:
             users = await cursor.fetchall()
     
-    success_count = 0
-    fail_count = 0
-    
     await message.answer(f"Starting broadcast to {len(users)} users...")
-    
-    for (user_id,) in users:
-        try:
-            await message.bot.send_message(
-                chat_id=user_id,
-                text=f"📢 <b>Broadcast Message from Admin:</b>\n\n{broadcast_text}",
-                parse_mode="HTML"
-            )
-            success_count += 1
-        except Exception as e:
-            fail_count += 1
-            print(f"Failed to send broadcast to user {user_id}: {str(e)}")
+
+    async def send(user_id: int):
+        await message.bot.send_message(
+            chat_id=user_id,
+            text=f"📢 <b>Broadcast Message from Admin:</b>\n\n{broadcast_text}",
+            parse_mode="HTML"
+        )
+
+    success_count, fail_count = await send_broadcast([user_id for (user_id,) in users], send)
     
     await message.answer(
         f"Broadcast completed!\n"
@@ -5,23 +5,37 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.markdown import hbold
 import aiohttp
-from datetime import datetime, timedelta
+import orjson
+from datetime import datetime
 import logging
-from typing import Optional
+from typing import Optional, DefaultDict
+from collections import defaultdict
 import asyncio
 
 from bot.keyboards import reply as kb
 from bot.services.storage import Storage
+from bot.services.http_client import get_session
+from bot.services.cache import CacheManager
 from bot.services.ai_providers import get_provider
 from bot.config import Config
-from bot.utils.message_sanitizer import sanitize_html_tags
 from bot.services.ai_providers.providers import PROVIDER_MODELS
-from bot.utils.rate_limiter import MessageRateLimiter
+from bot.utils.streaming import StreamedMessage
 
 router = Router()
 storage = Storage("data/chat.db")
 config = Config.from_env()
-rate_limiter = MessageRateLimiter()
+user_locks: DefaultDict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+generation_semaphore = asyncio.Semaphore(32)  # cap concurrent LLM streams across chats
+cache = CacheManager(max_size_mb=1)
+
+BTC_PRICE_TTL = 30  # seconds a fetched ticker is served from cache
+BTC_FETCH_RETRIES = 2
+MESSAGE_SPLIT_LENGTH = 4000  # chars per Telegram message, leaving room for closing tags
+VISION_IMAGE_SIDE = 1568  # px; Claude's native long edge, above OpenAI's 768px short-side target
+IMAGE_CACHE_TTL = 600  # seconds a downloaded photo is kept for reuse
+PROVIDERS_LIST = ", ".join(PROVIDER_MODELS.keys())
+# Downloaded photos by file_unique_id, so a resent or forwarded image skips Telegram
+image_cache = CacheManager(max_size_mb=32, default_ttl=IMAGE_CACHE_TTL)
 
 class UserStates(StatesGroup):
     """States for user interaction with the bot."""
@@ -31,17 +45,21 @@ class UserStates(StatesGroup):
     broadcasting = State()     # New state for broadcasting messages
 
 # Helper functions
+def is_admin(user_id: int) -> bool:
+    """Check if user is the bot admin"""
+    return user_id == config.admin_id
+
 def is_user_authorized(user_id: int) -> bool:
     """Check if user is authorized to use the bot"""
-    user_id_str = str(user_id)
-    return user_id_str == config.admin_id or user_id_str in config.allowed_user_ids
+    return user_id == config.admin_id or user_id in config.allowed_user_ids
 
 async def get_or_create_settings(user_id: int, message: Optional[Message] = None) -> Optional[dict]:
-    """Get user settings and update username if message is provided"""
+    """Get user settings and update username/first name if message is provided"""
     if message and message.from_user:
         await storage.ensure_user_exists(
             user_id=user_id,
-            username=message.from_user.username
+            username=message.from_user.username,
+            first_name=message.from_user.first_name
         )
     return await storage.get_user_settings(user_id)
 
@@ -51,8 +69,8 @@ async def cmd_start(message: Message, state: FSMContext):
     if not is_user_authorized(message.from_user.id):
         return
         
-    settings = await get_or_create_settings(message.from_user.id)
-    is_admin = str(message.from_user.id) == config.admin_id
+    # Record username/first name so admin stats can resolve names with a JOIN
+    settings = await get_or_create_settings(message.from_user.id, message)
 
     await state.clear()  # Clear any existing state
     await state.set_state(UserStates.chatting)  # Set initial state
@@ -63,7 +81,7 @@ async def cmd_start(message: Message, state: FSMContext):
             f"Current AI: {settings['current_provider']} "
             f"({settings['current_model']})\n\n"
             "You can start chatting now or use the menu buttons below.",
-            reply_markup=kb.get_main_menu(is_admin=is_admin)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
     else:
         await message.answer(
@@ -78,7 +96,7 @@ async def cmd_start(message: Message, state: FSMContext):
 async def handle_provider_choice(message: Message, state: FSMContext):
     provider = message.text.lower()
     if provider in PROVIDER_MODELS:  # Use PROVIDER_MODELS directly for validation
-        settings = await get_or_create_settings(message.from_user.id)
+        settings = await get_or_create_settings(message.from_user.id, message)
         if not settings:
             settings = {}
         settings['current_provider'] = provider
@@ -91,14 +109,13 @@ async def handle_provider_choice(message: Message, state: FSMContext):
         
         await message.answer(
             f"Provider changed to {message.text}. Ready to chat!",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
         await state.set_state(UserStates.chatting)
     else:
         # Show available providers from PROVIDER_MODELS
-        providers_list = ", ".join(PROVIDER_MODELS.keys())
         await message.answer(
-            f"Please select a provider from the menu: {providers_list}",
+            f"Please select a provider from the menu: {PROVIDERS_LIST}",
             reply_markup=kb.get_provider_menu()
         )
 
@@ -133,12 +150,13 @@ async def info_button(message: Message, state: FSMContext):
     
     settings = await storage.get_user_settings(message.from_user.id)
     
-    if settings:
+    # /start creates the users row before a provider is picked, so check the value itself
+    if settings and settings.get('current_provider'):
         await message.answer(
             f"ℹ️ Current Configuration:\n\n"
             f"Provider: {settings['current_provider']}\n"
             f"Model: {settings['current_model']}",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
     else:
         await message.answer(
@@ -154,51 +172,78 @@ async def clear_history(message: Message):
         return
     
     try:
-        await storage.clear_user_history(message.from_user.id)
+        # Wait for any in-flight turn so its reply isn't written back after the clear
+        async with user_locks[message.from_user.id]:
+            await storage.clear_user_history(message.from_user.id)
         await message.answer(
             "✅ Chat history cleared!",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
     except Exception as e:
         await message.answer(
             "❌ Error: Could not clear history",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
 
+async def fetch_btc_ticker() -> dict:
+    """Fetch BTC/USD ticker from Kraken"""
+    session = get_session()
+    for attempt in range(BTC_FETCH_RETRIES + 1):
+        try:
+            async with session.get(
+                'https://api.kraken.com/0/public/Ticker',
+                params={'pair': 'XBTUSD'},
+                timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                if response.status in (429, 500, 502, 503, 504):
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status
+                    )
+                data = orjson.loads(await response.read())
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == BTC_FETCH_RETRIES:
+                raise
+            await asyncio.sleep(0.3 * 2 ** attempt)  # Back off before retrying transient errors
+
+    if data.get('error'):
+        raise Exception(data['error'][0])
+
+    price_data = data['result']['XXBTZUSD']
+    return {
+        'current_price': float(price_data['c'][0]),
+        'high_24h': float(price_data['h'][1]),
+        'low_24h': float(price_data['l'][1]),
+        'volume': float(price_data['v'][1]),
+        'time': datetime.now().strftime("%H:%M")  # Removed seconds
+    }
+
 @router.message(F.text == "₿")
 async def btc_price(message: Message):
     if not is_user_authorized(message.from_user.id):
         return
-    
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get('https://api.kraken.com/0/public/Ticker?pair=XBTUSD') as response:
-                data = await response.json()
-                if data.get('error'):
-                    raise Exception(data['error'][0])
-                    
-                price_data = data['result']['XXBTZUSD']
-                current_price = float(price_data['c'][0])
-                high_24h = float(price_data['h'][1])
-                low_24h = float(price_data['l'][1])
-                volume = float(price_data['v'][1])
-                
-                time = datetime.now().strftime("%H:%M")  # Removed seconds
-                
-                await message.answer(
-                    f"<b>Bitcoin Price:</b>\n\n"
-                    f"🔼 <b>24h:</b> ${high_24h:,.0f}\n"  # Minimalistic green arrow for high
-                    f"💰 <b>Now:</b> <code>${current_price:,.0f}</code>\n"  # Highlighted current price
-                    f"🔽 <b>24h:</b> ${low_24h:,.0f}\n"  # Minimalistic red arrow for low
-                    f"📊 <b>24h Volume:</b> {volume:,.2f} BTC\n\n"
-                    f"🕒 <b>Time:</b> {time}",
-                    reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id),
-                    parse_mode='HTML'
-                )
+        # Serve repeated presses from cache without touching the network
+        ticker = cache.get("btc:ticker")
+        if ticker is None:
+            ticker = await fetch_btc_ticker()
+            cache.set("btc:ticker", ticker, ttl=BTC_PRICE_TTL)
+
+        await message.answer(
+            f"<b>Bitcoin Price:</b>\n\n"
+            f"🔼 <b>24h:</b> ${ticker['high_24h']:,.0f}\n"  # Minimalistic green arrow for high
+            f"💰 <b>Now:</b> <code>${ticker['current_price']:,.0f}</code>\n"  # Highlighted current price
+            f"🔽 <b>24h:</b> ${ticker['low_24h']:,.0f}\n"  # Minimalistic red arrow for low
+            f"📊 <b>24h Volume:</b> {ticker['volume']:,.2f} BTC\n\n"
+            f"🕒 <b>Time:</b> {ticker['time']}",
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id)),
+            parse_mode='HTML'
+        )
     except Exception as e:
         await message.answer(
             "❌ Error fetching BTC price from Kraken",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
 
 @router.message(F.text == "🔙 Back")
@@ -206,28 +251,32 @@ async def back_button(message: Message, state: FSMContext):
     if not is_user_authorized(message.from_user.id):
         return
     
-    is_admin = str(message.from_user.id) == config.admin_id
     await message.answer(
         "Main Menu",
-        reply_markup=kb.get_main_menu(is_admin=is_admin)
+        reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
     )
     await state.set_state(UserStates.chatting)
 
 # Chat handler for normal messages (put this AFTER button handlers)
 @router.message(UserStates.chatting)
 async def handle_message(message: Message, state: FSMContext):
+    """Handle chat messages one turn at a time per user so history writes don't interleave"""
+    async with user_locks[message.from_user.id]:
+        await process_chat_message(message, state)
+
+async def process_chat_message(message: Message, state: FSMContext):
     try:
-        user = message.from_user
-        if str(user.id) not in config.allowed_user_ids:
+        user_id = message.from_user.id
+        if user_id not in config.allowed_user_ids:
             return
 
         # Get settings and history concurrently
-        settings_task = storage.get_user_settings(message.from_user.id)
-        history_task = storage.get_chat_history(message.from_user.id, limit=20)  # Increased history limit
+        settings_task = storage.get_user_settings(user_id)
+        history_task = storage.get_chat_history(user_id, limit=20)  # Increased history limit
         
         settings, history = await asyncio.gather(settings_task, history_task)
         
-        if not settings or 'current_provider' not in settings:
+        if not settings or not settings.get('current_provider'):
             await message.answer(
                 "🤖 Please select an AI Model first:",
                 reply_markup=kb.get_provider_menu()
@@ -243,58 +292,75 @@ async def handle_message(message: Message, state: FSMContext):
         message_text = message.caption if message.caption else message.text
 
         if message.photo:
-            photo = message.photo[-1]
-            image_file = await message.bot.get_file(photo.file_id)
-            image_bytes = await message.bot.download_file(image_file.file_path)
-            image_data = image_bytes.read()
+            # Take the smallest size that still covers the vision models' native resolution;
+            # anything bigger is downscaled by the provider anyway
+            photo = next(
+                (size for size in message.photo if max(size.width, size.height) >= VISION_IMAGE_SIDE),
+                message.photo[-1]
+            )
+            image_data = image_cache.get(photo.file_unique_id)
+            if image_data is None:
+                image_file = await message.bot.get_file(photo.file_id)
+                image_bytes = await message.bot.download_file(image_file.file_path)
+                image_data = image_bytes.read()
+                image_cache.set(photo.file_unique_id, image_data)
             
             if not message_text:
                 message_text = "Please analyze this image."
 
-        # Add user message to history first
-        await storage.add_to_history(message.from_user.id, message_text, False, image_data)
-
-        # Get AI provider and prepare response
+        # Save the user message while the placeholder is sent; the placeholder
+        # itself tells the user we're working, so no separate chat action
         ai_provider = get_provider(provider_name, config)
-        await message.bot.send_chat_action(message.chat.id, "typing")
-        bot_response = await message.answer("Processing...")
+        _, bot_response = await asyncio.gather(
+            storage.add_to_history(user_id, message_text, False, image_data),
+            message.answer("Processing...")
+        )
         
-        # Stream the response
-        collected_response = ""
-        async for response_chunk in ai_provider.chat_completion_stream(
-            message=message_text,
-            model_config=model_config,
-            history=history,
-            image=image_data
-        ):
-            if response_chunk and response_chunk.strip():
-                collected_response += response_chunk
-                logging.debug(f"Received chunk: {response_chunk}")
-                sanitized_response = sanitize_html_tags(collected_response)
-                if await rate_limiter.should_update_message(sanitized_response):
-                    try:
-                        await bot_response.edit_text(sanitized_response, parse_mode="HTML")
-                        await asyncio.sleep(0.5)
-                    except Exception as e:
-                        if "message is not modified" not in str(e).lower():
-                            logging.warning(f"Message update error: {e}")
-                        continue
-
-        # Save AI response to history
-        if collected_response:
-            await storage.add_to_history(message.from_user.id, collected_response, True)
+        # Stream the response; each turn tracks its own edits so chats don't interfere
+        # Edits are paced by time and size alone; the stream keeps being read in between
+        stream = StreamedMessage(bot_response)
+        finished_segments = []  # Text already finalized into earlier Telegram messages
+        async with generation_semaphore:
+            async for response_chunk in ai_provider.chat_completion_stream(
+                message=message_text,
+                model_config=model_config,
+                history=history,
+                image=image_data
+            ):
+                if response_chunk:  # Whitespace-only chunks carry the reply's line breaks
+                    stream.append(response_chunk)
+                    logging.debug("Received chunk: %s", response_chunk)
+                    if stream.length > MESSAGE_SPLIT_LENGTH:
+                        # Telegram rejects edits past 4096 chars: finish this message
+                        # at a line break and continue the reply in a new one
+                        head, tail = stream.split(MESSAGE_SPLIT_LENGTH)
+                        await stream.finish(head)
+                        finished_segments.append(head)
+                        stream.reset(await message.answer("Processing..."))
+                        stream.append(tail)
+                    stream.maybe_edit()
+
+        await stream.settle()
+        current_segment = stream.text
+        collected_response = ''.join(finished_segments) + current_segment
+
+        # Whitespace-only chunks are kept too, so check for any visible text
+        if not collected_response.strip():
+            return
+
+        # Save AI response to history while the final edit goes out
+        final_updates = [storage.add_to_history(user_id, collected_response, True)]
 
         # Handle final message update
-        if collected_response and collected_response.strip():
-            final_response = sanitize_html_tags(collected_response)
-            if final_response.strip() != rate_limiter.current_message:
-                await MessageRateLimiter.retry_final_update(bot_response, final_response)
-            rate_limiter.current_message = None
-            logging.info(f"Completed processing message for user {user.id}")
+        # Skip the final edit (and its sanitize pass) if the last successful edit was already complete
+        if not stream.is_complete():
+            final_updates.append(stream.finish(current_segment))
+        await asyncio.gather(*final_updates)
+        logging.info("Completed processing message for user %s", user_id)
 
         # Log usage statistics
         await storage.log_usage(
-            user_id=message.from_user.id,
+            user_id=user_id,
             provider=provider_name,
             model=model_config['name'],
             tokens=len(collected_response.split()),
@@ -328,5 +394,5 @@ async def handle_unauthorized(message: Message, state: FSMContext):
         # If in a state but message not handled by other handlers
         await message.answer(
             "Please use the menu buttons or send a message to chat.",
-            reply_markup=kb.get_main_menu(is_admin=str(message.from_user.id) == config.admin_id)
+            reply_markup=kb.get_main_menu(is_admin=is_admin(message.from_user.id))
         )
\ No newline at end of file
@@ -2,7 +2,9 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 from bot.services.ai_providers.providers import PROVIDER_MODELS
 
-def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
+# Keyboards are static, so they are built once at import and reused per message
+
+def _build_main_menu(is_admin: bool) -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(
         KeyboardButton(text="🤖 Choose AI Model"),
@@ -16,7 +18,7 @@ def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
         builder.row(KeyboardButton(text="👑 Admin"))
     return builder.as_markup(resize_keyboard=True)
 
-def get_admin_menu() -> ReplyKeyboardMarkup:
+def _build_admin_menu() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(
         KeyboardButton(text="📊 Stats"),
@@ -25,7 +27,7 @@ def get_admin_menu() -> ReplyKeyboardMarkup:
     builder.row(KeyboardButton(text="🔙 Back"))
     return builder.as_markup(resize_keyboard=True)
 
-def get_provider_menu() -> ReplyKeyboardMarkup:
+def _build_provider_menu() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     
     # Create pairs of providers
@@ -39,12 +41,34 @@ def get_provider_menu() -> ReplyKeyboardMarkup:
     builder.row(KeyboardButton(text="🔙 Back"))
     return builder.as_markup(resize_keyboard=True)
 
-def get_back_menu() -> ReplyKeyboardMarkup:
+def _build_back_menu() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.add(KeyboardButton(text="🔙 Back"))
     return builder.as_markup(resize_keyboard=True)
 
-def get_welcome_keyboard() -> ReplyKeyboardMarkup:
+def _build_welcome_keyboard() -> ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
     builder.row(KeyboardButton(text="🚀 Start Bot"))
     return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
+
+MAIN_MENU = _build_main_menu(is_admin=False)
+ADMIN_MAIN_MENU = _build_main_menu(is_admin=True)
+ADMIN_MENU = _build_admin_menu()
+PROVIDER_MENU = _build_provider_menu()
+BACK_MENU = _build_back_menu()
+WELCOME_KEYBOARD = _build_welcome_keyboard()
+
+def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
+    return ADMIN_MAIN_MENU if is_admin else MAIN_MENU
+
+def get_admin_menu() -> ReplyKeyboardMarkup:
+    return ADMIN_MENU
+
+def get_provider_menu() -> ReplyKeyboardMarkup:
+    return PROVIDER_MENU
+
+def get_back_menu() -> ReplyKeyboardMarkup:
+    return BACK_MENU
+
+def get_welcome_keyboard() -> ReplyKeyboardMarkup:
+    return WELCOME_KEYBOARD
@@ -1,22 +1,50 @@
 from typing import Dict
 from .base import BaseAIProvider
-from .openai import OpenAIProvider
-from .claude import ClaudeProvider
-from .groq import GroqProvider
-from .perplexity import PerplexityProvider
 from ...config import Config
 
+# Provider instances hold their SDK client and connection pool, so build each once
+_provider_cache: Dict[str, BaseAIProvider] = {}
+
+# Provider modules are imported on first use so only the SDKs users actually pick get loaded
+def _make_openai(config: Config) -> BaseAIProvider:
+    from .openai import OpenAIProvider
+    return OpenAIProvider(config.openai_api_key, config=config)
+
+def _make_claude(config: Config) -> BaseAIProvider:
+    from .claude import ClaudeProvider
+    return ClaudeProvider(config.anthropic_api_key, config=config)
+
+def _make_groq(config: Config) -> BaseAIProvider:
+    from .groq import GroqProvider
+    return GroqProvider(config.groq_api_key, config=config)
+
+def _make_perplexity(config: Config) -> BaseAIProvider:
+    from .perplexity import PerplexityProvider
+    return PerplexityProvider(config.perplexity_api_key, config=config)
+
+_PROVIDER_FACTORIES = {
+    'openai': _make_openai,
+    'claude': _make_claude,
+    'groq': _make_groq,
+    'perplexity': _make_perplexity
+}
+
 def get_provider(provider_name: str, config: Config) -> BaseAIProvider:
     """Get AI provider instance by name."""
-    providers = {
-        'openai': lambda: OpenAIProvider(config.openai_api_key, config=config),
-        'claude': lambda: ClaudeProvider(config.anthropic_api_key, config=config),
-        'groq': lambda: GroqProvider(config.groq_api_key, config=config),
-        'perplexity': lambda: PerplexityProvider(config.perplexity_api_key, config=config)
-    }
-    
-    provider_factory = providers.get(provider_name)
+    provider = _provider_cache.get(provider_name)
+    if provider is not None:
+        return provider
+
+    provider_factory = _PROVIDER_FACTORIES.get(provider_name)
     if not provider_factory:
         raise ValueError(f"Unknown provider: {provider_name}")
-    
-    return provider_factory()
+
+    provider = provider_factory(config)
+    _provider_cache[provider_name] = provider
+    return provider
+
+async def close_providers() -> None:
+    """Close the pooled SDK clients of every provider built so far."""
+    for provider in _provider_cache.values():
+        await provider.client.close()
+    _provider_cache.clear()
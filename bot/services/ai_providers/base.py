@@ -1,10 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict, Any, AsyncGenerator
-import base64
+from typing import Optional, List, Dict, Any, AsyncGenerator, Callable
+import httpx
 from bot.config import Config
-import re
-import logging
-from openai import AsyncOpenAI
+
+# The prompt is static, so build it once at import instead of on every request
+_BASE_PROMPT = """You are a helpful AI assistant."""
+_CONTEXT_INSTRUCTIONS = """
+        Maintain full context of the conversation and provide accurate, consistent responses. 
+        When dealing with calculations or sequential operations, always consider the entire conversation history.
+        Format responses using HTML tags and emojis appropriately.
+        """
+CONTEXT_SYSTEM_PROMPT = f"{_BASE_PROMPT}\n{_CONTEXT_INSTRUCTIONS}"
+
+def build_http_client(client_factory: Callable[..., httpx.AsyncClient], max_connections: int) -> httpx.AsyncClient:
+    """Build a pooled HTTP/2 client with the SDK's own DefaultAsyncHttpxClient defaults"""
+    return client_factory(
+        http2=True,  # Concurrent streams to the same API multiplex over one connection
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=20)
+    )
 
 class BaseAIProvider(ABC):
     """Base class for AI providers implementing common interface."""
@@ -14,13 +27,7 @@ class BaseAIProvider(ABC):
 
     def _get_system_prompt(self, model_name: str) -> str:
         """Get the system prompt with context maintenance instructions"""
-        base_prompt = """You are a helpful AI assistant."""
-        context_instructions = """
-        Maintain full context of the conversation and provide accurate, consistent responses. 
-        When dealing with calculations or sequential operations, always consider the entire conversation history.
-        Format responses using HTML tags and emojis appropriately.
-        """
-        return f"{base_prompt}\n{context_instructions}"
+        return CONTEXT_SYSTEM_PROMPT
 
     @abstractmethod
     async def chat_completion_stream(
@@ -33,72 +40,32 @@ class BaseAIProvider(ABC):
         """Generate a streaming response from the AI model."""
         pass
 
-    def _format_history(self, history: List[Dict[str, Any]], model_config: Dict[str, Any]) -> List[Dict[str, str]]:
-        """Format chat history into provider-specific format."""
-        formatted_messages = []
-        
-        # Process history in chronological order
+    def _format_text_messages(
+        self,
+        message: str,
+        model_config: Dict[str, Any],
+        history: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, str]]:
+        """Build system prompt, history and current message for text-only chat APIs in one pass."""
+        messages = [{
+            "role": "system",
+            "content": self._get_system_prompt(model_config['name'])
+        }]
         if history:
-            for msg in history:
-                # Skip any system messages in history
-                if msg.get("role") == "system":
-                    continue
-                
-                if msg.get("is_bot"):
-                    formatted_messages.append({
-                        "role": "assistant",
-                        "content": msg["content"]
-                    })
-                else:
-                    content = msg["content"]
-                    image_data = msg.get("image")
-                    
-                    if image_data and self._supports_vision(model_config):
-                        base64_image = base64.b64encode(image_data).decode('utf-8')
-                        # Depending on provider, format messages appropriately
-                        if model_config['name'].startswith("golq"):
-                            # Groq-specific formatting
-                            formatted_content = [
-                                {"type": "text", "text": content},
-                                {"type": "image_url", "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }}
-                            ]
-                        else:
-                            # Default formatting
-                            formatted_content = [
-                                {"type": "text", "text": content},
-                                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64_image}"}
-                            ]
-                        
-                        formatted_messages.append({
-                            "role": "user",
-                            "content": formatted_content
-                        })
-                    else:
-                        formatted_messages.append({
-                            "role": "user",
-                            "content": content
-                        })
-        
-        return formatted_messages
+            messages.extend(
+                {"role": "assistant" if msg.get("is_bot") else "user", "content": msg["content"]}
+                for msg in history
+            )
+        messages.append({
+            "role": "user",
+            "content": message
+        })
+        return messages
 
     def _supports_vision(self, model_config: Dict[str, Any]) -> bool:
         """Check if the model supports vision features."""
         return model_config.get('vision', False)
 
-    def _format_image_message(self, text: str, base64_image: str) -> Dict[str, Any]:
-        """Format image message based on provider requirements."""
-        return {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": text},
-                {"type": "image_url", "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64_image}"
-                }}
-            ]
-        }
-
     def _get_max_tokens(self, model_config: Dict[str, Any]) -> int:
         """Get max tokens for the model."""
         return model_config.get('max_tokens', 4000)
@@ -1,15 +1,17 @@
 from typing import Optional, List, Dict, Any, AsyncGenerator
-from anthropic import AsyncAnthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 import base64
 import logging
-from .base import BaseAIProvider
-from ...config.prompts import get_system_prompt
+from .base import BaseAIProvider, build_http_client
 from ...config.settings import Config
 
 class ClaudeProvider(BaseAIProvider):
     def __init__(self, api_key: str, config: Config = None):
         super().__init__(config)
-        self.client = AsyncAnthropic(api_key=api_key)
+        self.client = AsyncAnthropic(
+            api_key=api_key,
+            http_client=build_http_client(DefaultAsyncHttpxClient, max_connections=40)
+        )
         
     async def chat_completion_stream(
         self, 
@@ -18,37 +20,11 @@ class ClaudeProvider(BaseAIProvider):
         history: Optional[List[Dict[str, Any]]] = None,
         image: Optional[bytes] = None
     ) -> AsyncGenerator[str, None]:
-        messages = []
-        
-        if history:
-            for msg in history:
-                if msg.get("is_bot"):
-                    messages.append({
-                        "role": "assistant",
-                        "content": msg["content"]
-                    })
-                else:
-                    content = msg["content"]
-                    img_data = msg.get("image")
-                    
-                    if img_data and model_config.get('vision'):
-                        base64_image = base64.b64encode(img_data).decode('utf-8')
-                        messages.append({
-                            "role": "user",
-                            "content": [
-                                {"type": "image", "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": base64_image
-                                }},
-                                {"type": "text", "text": content}
-                            ]
-                        })
-                    else:
-                        messages.append({
-                            "role": "user",
-                            "content": content
-                        })
+        # History rows are text only (images are stored as references), so map roles directly
+        messages = [
+            {"role": "assistant" if msg.get("is_bot") else "user", "content": msg["content"]}
+            for msg in (history or ())
+        ]
         
         # Add current message with image if present
         if image and model_config.get('vision'):
@@ -82,19 +58,11 @@ class ClaudeProvider(BaseAIProvider):
             )
             
             async for chunk in stream:
-                # Handle different types of streaming responses
-                if hasattr(chunk, 'type'):
-                    if chunk.type == 'content_block_start':
-                        continue
-                    elif chunk.type == 'content_block_delta':
-                        if hasattr(chunk, 'delta') and hasattr(chunk.delta, 'text'):
-                            yield chunk.delta.text
-                    elif chunk.type == 'message_delta':
-                        if hasattr(chunk, 'delta') and hasattr(chunk.delta, 'content'):
-                            yield chunk.delta.content
-                elif hasattr(chunk, 'content'):
-                    # Handle non-streaming response format
-                    yield chunk.content
+                # Only text deltas carry output; every other event is skipped on a single compare
+                if chunk.type == 'content_block_delta':
+                    text = getattr(chunk.delta, 'text', None)
+                    if text:
+                        yield text
                     
         except Exception as e:
             logging.error(f"Claude error: {str(e)}", exc_info=True)
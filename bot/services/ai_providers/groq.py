@@ -1,9 +1,7 @@
-from groq import AsyncGroq
 from typing import Optional, List, Dict, Any, AsyncGenerator
-import base64
 from .base import BaseAIProvider
+from .openai import get_http_client
 from ...config.settings import Config
-from ...config.prompts import get_system_prompt
 import logging
 from openai import AsyncOpenAI
 
@@ -12,7 +10,8 @@ class GroqProvider(BaseAIProvider):
         super().__init__(config)
         self.client = AsyncOpenAI(
             api_key=api_key,
-            base_url="https://api.groq.com/openai/v1"
+            base_url="https://api.groq.com/openai/v1",
+            http_client=get_http_client()
         )
 
     async def chat_completion_stream(
@@ -24,30 +23,7 @@ class GroqProvider(BaseAIProvider):
     ) -> AsyncGenerator[str, None]:
         logging.info("GroqProvider: Starting chat_completion_stream")
         try:
-            messages = [{
-                "role": "system",
-                "content": self._get_system_prompt(model_config['name'])
-            }]
-            
-            # Add history
-            if history:
-                for msg in history:
-                    if msg.get("is_bot"):
-                        messages.append({
-                            "role": "assistant",
-                            "content": msg["content"]
-                        })
-                    else:
-                        messages.append({
-                            "role": "user",
-                            "content": msg["content"]
-                        })
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": message
-            })
+            messages = self._format_text_messages(message, model_config, history)
 
             stream = await self.client.chat.completions.create(
                 model=model_config['name'],
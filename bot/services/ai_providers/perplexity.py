@@ -1,7 +1,7 @@
 from typing import Dict, Any, List, Optional, AsyncGenerator
 from openai import AsyncOpenAI
 from .base import BaseAIProvider
-from ...config.prompts import get_system_prompt
+from .openai import get_http_client
 from ...config.settings import Config
 import logging
 
@@ -10,46 +10,38 @@ class PerplexityProvider(BaseAIProvider):
         super().__init__(config)
         self.client = AsyncOpenAI(
             api_key=api_key,
-            base_url="https://api.perplexity.ai"
+            base_url="https://api.perplexity.ai",
+            http_client=get_http_client()
         )
 
-    def _format_messages(self, history: List[Dict[str, Any]], current_message: str, model_config: Dict[str, Any]) -> List[Dict[str, str]]:
-        """Format message history ensuring strict user/assistant alternation."""
+    def _format_alternating_messages(
+        self,
+        message: str,
+        model_config: Dict[str, Any],
+        history: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, str]]:
+        """Build messages in one pass, merging same-role runs since Perplexity requires strict alternation."""
         messages = [{
             "role": "system",
             "content": self._get_system_prompt(model_config['name'])
         }]
+        last_role = "system"
+        for msg in (history or ()):
+            role = "assistant" if msg.get("is_bot") else "user"
+            if role == last_role:
+                # e.g. a user message whose reply failed; fold it into the previous turn
+                messages[-1] = {"role": role, "content": f"{messages[-1]['content']}\n\n{msg['content']}"}
+            elif role == "assistant" and last_role == "system":
+                # The history window may start mid-exchange; the first turn must be the user's
+                continue
+            else:
+                messages.append({"role": role, "content": msg["content"]})
+                last_role = role
 
-        # Process history to ensure alternating pattern
-        formatted_history = []
-        for i in range(0, len(history), 2):
-            # Add user message
-            if i < len(history):
-                user_msg = history[i]
-                if not user_msg.get("is_bot"):
-                    formatted_history.append({
-                        "role": "user",
-                        "content": user_msg["content"]
-                    })
-
-            # Add assistant message
-            if i + 1 < len(history):
-                assistant_msg = history[i + 1]
-                if assistant_msg.get("is_bot"):
-                    formatted_history.append({
-                        "role": "assistant",
-                        "content": assistant_msg["content"]
-                    })
-
-        # Add formatted history
-        messages.extend(formatted_history)
-
-        # Add current message
-        messages.append({
-            "role": "user",
-            "content": current_message
-        })
-
+        if last_role == "user":
+            messages[-1] = {"role": "user", "content": f"{messages[-1]['content']}\n\n{message}"}
+        else:
+            messages.append({"role": "user", "content": message})
         return messages
 
     async def chat_completion_stream(
@@ -60,32 +52,9 @@ class PerplexityProvider(BaseAIProvider):
         image: Optional[bytes] = None
     ) -> AsyncGenerator[str, None]:
         try:
-            messages = [{
-                "role": "system",
-                "content": self._get_system_prompt(model_config['name'])
-            }]
-
-            # Add history
-            if history:
-                for msg in history:
-                    if msg.get("is_bot"):
-                        messages.append({
-                            "role": "assistant",
-                            "content": msg["content"]
-                        })
-                    else:
-                        messages.append({
-                            "role": "user",
-                            "content": msg["content"]
-                        })
-
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": message
-            })
+            messages = self._format_alternating_messages(message, model_config, history)
 
-            logging.debug(f"Formatted messages for Perplexity: {messages}")
+            logging.debug("Formatted messages for Perplexity: %s", messages)
 
             stream = await self.client.chat.completions.create(
                 model=model_config['name'],
@@ -1,18 +1,21 @@
-PROVIDER_MODELS = {
-    "openai": {
+from types import MappingProxyType
+
+# Read-only: shared by every handler and concurrent turn
+PROVIDER_MODELS = MappingProxyType({
+    "openai": MappingProxyType({
         "name": "chatgpt-4o-latest",
         "vision": True
-    },
-    "groq": {
+    }),
+    "groq": MappingProxyType({
         "name": "llama-3.3-70b-versatile",
         "vision": False
-    },
-    "claude": {
+    }),
+    "claude": MappingProxyType({
         "name": "claude-3-5-sonnet-20241022",
         "vision": True
-    },
-    "perplexity": {
+    }),
+    "perplexity": MappingProxyType({
         "name": "llama-3.1-sonar-large-128k-online",
         "vision": False
-    }
-} 
\ No newline at end of file
+    })
+})
@@ -3,14 +3,18 @@ import time
 import logging
 
 class CacheManager:
-    def __init__(self, max_size_mb: int = 50):
+    def __init__(self, max_size_mb: int = 50, default_ttl: int = 300):
         self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.default_ttl = default_ttl
+        # key -> (value, expires_at, size)
         self.cache: Dict[str, tuple[Any, float, int]] = {}
         self.current_size = 0
     
     def _estimate_size(self, value: Any) -> int:
         """Estimate size of cached value in bytes"""
         try:
+            if isinstance(value, (bytes, bytearray)):
+                return len(value)  # str() of bytes is its repr, several times larger
             if isinstance(value, list):
                 total_size = 0
                 for item in value:
@@ -27,7 +31,7 @@ class CacheManager:
             return 0
     
     def _cleanup_old_entries(self, required_space: int):
-        """Remove old entries to free up space"""
+        """Remove entries closest to expiry to free up space"""
         sorted_items = sorted(self.cache.items(), key=lambda x: x[1][1])
         
         for key, (_, _, size) in sorted_items:
@@ -38,8 +42,8 @@ class CacheManager:
     
     def get(self, key: str) -> Optional[Any]:
         if key in self.cache:
-            value, timestamp, _ = self.cache[key]
-            if time.time() - timestamp < 300:  # 5 minutes TTL
+            value, expires_at, _ = self.cache[key]
+            if time.time() < expires_at:
                 return value
             self.invalidate(key)
         return None
@@ -61,7 +65,8 @@ class CacheManager:
                 _, _, old_size = self.cache[key]
                 self.current_size -= old_size
             
-            self.cache[key] = (value, time.time(), size)
+            expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+            self.cache[key] = (value, expires_at, size)
             self.current_size += size
             
         except Exception as e:
@@ -0,0 +1,21 @@
+from typing import Optional
+import aiohttp
+
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session, creating it lazily inside the running event loop"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+    return _session
+
+async def close_session() -> None:
+    """Close the shared HTTP session on shutdown"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -1,14 +1,17 @@
-from typing import Dict, Any, List, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Set
+from datetime import datetime, timezone
 import aiosqlite
 import os
 import logging
 import asyncio
 from contextlib import asynccontextmanager
-import json
+import orjson
 from collections import deque
-from .cache import CacheManager  # Assuming cache.py is created
 import hashlib
+import tempfile
+
+USAGE_FLUSH_INTERVAL = 1.0  # seconds usage rows wait before being written
+USAGE_BATCH_SIZE = 50
 
 class DatabasePool:
     def __init__(self, db_path: str, max_connections: int = 5):
@@ -54,6 +57,16 @@ class Storage:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.pool = DatabasePool(db_path)
         self._lock = asyncio.Lock()
+        self._initialized = False
+        # Write-through cache of user settings; save_user_settings keeps it current
+        self._settings_cache: Dict[int, dict] = {}
+        # Recent history window per user as (limit, rows), appended to on every write
+        self._history_cache: Dict[int, tuple] = {}
+        # Usage rows are buffered and written in batches off the reply path
+        self._usage_buffer: List[tuple] = []
+        self._usage_flush_task: Optional[asyncio.Task] = None
+        # Strong references to size-triggered flushes so they aren't garbage-collected mid-write
+        self._flush_tasks: Set[asyncio.Task] = set()
 
     @asynccontextmanager
     async def _db_connect(self):
@@ -63,46 +76,67 @@ class Storage:
         finally:
             await self.pool.release(db)
 
+    async def fetch_all(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Run a read-only query on a pooled connection"""
+        async with self._db_connect() as db:
+            async with db.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
     async def get_chat_history(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Get chat history with optimized retrieval"""
+        cached = self._history_cache.get(user_id)
+        if cached is not None and cached[0] == limit:
+            return list(cached[1])
+
         try:
             async with self._db_connect() as db:
-                # Get all recent messages in chronological order
+                # Walk the (user_id, timestamp DESC) index and stop after the window,
+                # instead of numbering every row the user ever sent
                 async with db.execute("""
-                    WITH LastMessages AS (
-                        SELECT 
-                            content,
-                            is_bot,
-                            timestamp,
-                            ROW_NUMBER() OVER (ORDER BY timestamp DESC) as rn
-                        FROM chat_history
-                        WHERE user_id = ?
-                    )
-                    SELECT 
+                    SELECT
                         content,
                         is_bot,
                         timestamp
-                    FROM LastMessages
-                    WHERE rn <= ?  -- Take last N messages
-                    ORDER BY timestamp ASC
+                    FROM chat_history
+                    WHERE user_id = ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
                 """, (user_id, limit * 2)) as cursor:  # Double limit to include both user and bot messages
                     rows = await cursor.fetchall()
-            
-                result = []
-                for row in rows:
-                    message = {
+
+                # Rows come newest first; return them in chronological order
+                history = [
+                    {
                         "content": row[0],
                         "is_bot": bool(row[1]),
                         "timestamp": row[2]
                     }
-                    result.append(message)
-            
-                return result
+                    for row in reversed(rows)
+                ]
+                self._history_cache[user_id] = (limit, deque(history, maxlen=limit * 2))
+                return history
             
         except Exception as e:
             logging.error(f"Error getting chat history: {e}", exc_info=True)
             return []
 
+    @staticmethod
+    def _save_image(image_data: bytes) -> str:
+        """Write image to disk and return its hash (blocking, run in a worker thread)"""
+        image_hash = hashlib.md5(image_data).hexdigest()
+        image_path = f"data/images/{image_hash}.jpg"
+        # Files are named by content hash, so an existing file already holds these bytes
+        if os.path.exists(image_path):
+            return image_hash
+
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(image_path), suffix=".tmp")
+        with os.fdopen(fd, "wb", buffering=1 << 16) as f:
+            f.write(image_data)
+        os.replace(tmp_path, image_path)
+        return image_hash
+
     async def add_to_history(
         self,
         user_id: int,
@@ -112,23 +146,23 @@ class Storage:
     ) -> None:
         """Add message to history with optimized storage"""
         try:
-            content_str = str(content).strip() if content else ""
-        
+            content_str = content.strip() if content else ""  # Callers always pass str or None
+
+            image_hash = None
+            if image_data:
+                # Hashing and the disk write block, so keep them off the event loop
+                image_hash = await asyncio.to_thread(self._save_image, image_data)
+
             async with self._db_connect() as db:
-                if image_data:
+                if image_hash:
                     # Only store latest image
                     await db.execute("""
                         UPDATE chat_history 
                         SET content = REPLACE(content, '[Image:', '[Old Image:')
                         WHERE user_id = ? AND content LIKE '%[Image:%'
                     """, (user_id,))
-                
+
                     # Store image reference instead of full data
-                    image_hash = hashlib.md5(image_data).hexdigest()
-                    image_path = f"data/images/{image_hash}.jpg"
-                    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                    with open(image_path, "wb") as f:
-                        f.write(image_data)
                     content_str = f"{content_str}\n[Image: {image_hash}]"
             
                 # Add message with precise timestamp
@@ -144,7 +178,28 @@ class Storage:
                     )
                 """, (user_id, content_str, 1 if is_bot else 0))
 
+                if not is_bot:
+                    # Touch activity in the same transaction instead of a separate round-trip
+                    await db.execute("""
+                        UPDATE users SET last_activity = CURRENT_TIMESTAMP
+                        WHERE user_id = ?
+                    """, (user_id,))
+
                 await db.commit()
+
+            cached = self._history_cache.get(user_id)
+            if cached is not None:
+                rows = cached[1]
+                if image_hash:
+                    # Mirror the '[Old Image:' rewrite above on just the rows that carry an image
+                    for i, row in enumerate(rows):
+                        if '[Image:' in row["content"]:
+                            rows[i] = {**row, "content": row["content"].replace('[Image:', '[Old Image:')}
+                rows.append({
+                    "content": content_str,
+                    "is_bot": bool(is_bot),
+                    "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+                })
             
         except Exception as e:
             logging.error(f"Error adding to chat history: {e}", exc_info=True)
@@ -159,6 +214,7 @@ class Storage:
                     (user_id,)
                 )
                 await db.commit()
+            self._history_cache.pop(user_id, None)
                 
         except Exception as e:
             logging.error(f"Error clearing user history: {e}")
@@ -166,6 +222,10 @@ class Storage:
 
     async def get_user_settings(self, user_id: int) -> Optional[dict]:
         """Get user settings"""
+        cached = self._settings_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)  # Callers mutate the result before saving
+
         try:
             async with self._db_connect() as db:
                 async with db.execute("""
@@ -175,12 +235,13 @@ class Storage:
                 """, (user_id,)) as cursor:
                     row = await cursor.fetchone()
                     if row:
-                        settings = json.loads(row[0]) if row[0] else {}
+                        settings = orjson.loads(row[0]) if row[0] else {}
                         settings.update({
                             'current_provider': row[1],
                             'current_model': row[2]
                         })
-                        return settings
+                        self._settings_cache[user_id] = settings
+                        return dict(settings)
                     return None
         except Exception as e:
             logging.error(f"Error getting user settings: {e}")
@@ -188,7 +249,11 @@ class Storage:
 
     async def ensure_initialized(self):
         """Initialize the database with all required tables"""
+        if self._initialized:
+            return
         async with self._lock:
+            if self._initialized:
+                return
             try:
                 async with self._db_connect() as db:
                     # Create users table first
@@ -251,6 +316,7 @@ class Storage:
                     os.makedirs("data/images", exist_ok=True)
 
                     await db.commit()
+                self._initialized = True
 
             except Exception as e:
                 logging.error(f"Database initialization error: {e}", exc_info=True)
@@ -271,97 +337,18 @@ class Storage:
                             updated_at = CURRENT_TIMESTAMP
                         WHERE user_id = ?
                     """, (
-                        json.dumps(settings),
+                        orjson.dumps(settings).decode(),
                         settings.get('current_provider'),
                         settings.get('current_model'),
                         user_id
                     ))
                     await db.commit()
+                self._settings_cache[user_id] = dict(settings)
             except Exception as e:
+                self._settings_cache.pop(user_id, None)
                 logging.error(f"Error saving user settings: {e}")
                 raise
 
-    async def add_message(self, user_id: int, content: str, is_bot: bool, image_data: Optional[bytes] = None):
-        await self.ensure_initialized()
-        async with self._lock:
-            try:
-                async with self._db_connect() as db:
-                    # If this is a new message with an image, remove previous image messages
-                    if image_data:
-                        await db.execute("""
-                            UPDATE chat_history 
-                            SET image_data = NULL 
-                            WHERE user_id = ? AND image_data IS NOT NULL
-                        """, (user_id,))
-                    
-                    await db.execute(
-                        """INSERT INTO chat_history (user_id, content, is_bot) 
-                           VALUES (?, ?, ?)""",
-                        (user_id, content, is_bot)
-                    )
-                    await db.commit()
-            except Exception as e:
-                logging.error(f"Error adding message: {e}")
-                raise
-    async def get_user(self, user_id: int) -> Dict[str, Any]:
-        """Get user data from the database"""
-        try:
-            async with self._db_connect() as db:
-                async with db.execute("""
-                    SELECT 
-                        user_id,
-                        username,
-                        current_provider,
-                        current_model,
-                        settings,
-                        last_activity
-                    FROM users 
-                    WHERE user_id = ?
-                """, (user_id,)) as cursor:
-                    row = await cursor.fetchone()
-                    
-                    if row:
-                        return {
-                            "user_id": row[0],
-                            "username": row[1],
-                            "current_provider": row[2],  # Default to claude if None
-                            "current_model": row[3],  # Default model
-                            "settings": row[4],
-                            "last_activity": row[5]
-                        }
-                    
-                    # If user doesn't exist, create new user with default settings
-                    await db.execute("""
-                        INSERT INTO users (
-                            user_id, 
-                            current_provider,
-                            current_model,
-                            settings
-                        ) VALUES (?, '{}')
-                    """, (user_id,))
-                    await db.commit()
-                    
-                    return {
-                        "user_id": user_id,
-                        "username": None,
-                        "current_provider": None,  # Default provider with no value
-                        "current_model": None,      # Default model with no value
-                        "settings": "{}",
-                        "last_activity": None
-                    }
-                    
-        except Exception as e:
-            logging.error(f"Error getting user data: {e}")
-            # Return default values if there's an error
-            return {
-                "user_id": user_id,
-                "username": None,
-                "current_provider": None,
-                "current_model": None,
-                "settings": "{}",
-                "last_activity": None
-            }
-
     async def ensure_user_exists(self, user_id: int, username: str = None, first_name: str = None):
         """Ensure user exists in database and update user info"""
         await self.ensure_initialized()
@@ -395,10 +382,34 @@ class Storage:
         tokens: int = 0,
         has_image: bool = False
     ) -> None:
-        """Log usage statistics for a user"""
+        """Queue usage statistics for a user; rows are written in batches"""
+        self._usage_buffer.append((
+            user_id,
+            provider,
+            model,
+            tokens,
+            1 if has_image else 0,
+            datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")  # Same format as CURRENT_TIMESTAMP
+        ))
+        if len(self._usage_buffer) >= USAGE_BATCH_SIZE:
+            task = asyncio.create_task(self.flush_usage())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        elif self._usage_flush_task is None or self._usage_flush_task.done():
+            self._usage_flush_task = asyncio.create_task(self._flush_usage_later())
+
+    async def _flush_usage_later(self):
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        await self.flush_usage()
+
+    async def flush_usage(self) -> None:
+        """Write buffered usage rows in a single transaction"""
+        if not self._usage_buffer:
+            return
+        batch, self._usage_buffer = self._usage_buffer, []
         try:
             async with self._db_connect() as db:
-                await db.execute("""
+                await db.executemany("""
                     INSERT INTO usage_stats (
                         user_id,
                         provider,
@@ -407,8 +418,8 @@ class Storage:
                         token_count,
                         image_count,
                         timestamp
-                    ) VALUES (?, ?, ?, 1, ?, ?, CURRENT_TIMESTAMP)
-                """, (user_id, provider, model, tokens, 1 if has_image else 0))
+                    ) VALUES (?, ?, ?, 1, ?, ?, ?)
+                """, batch)
                 await db.commit()
         except Exception as e:
             logging.error(f"Error logging usage stats: {e}")
@@ -2,6 +2,19 @@ import re
 from typing import Optional
 import logging
 
+# Tags supported by Telegram's HTML parse mode
+_ALLOWED_TAG_NAMES = ('b', 'i', 'u', 's', 'code', 'pre', 'a')
+ALLOWED_TAGS = frozenset(_ALLOWED_TAG_NAMES)
+_ALLOWED_TAGS_PATTERN = '|'.join(_ALLOWED_TAG_NAMES)
+
+# Compiled once; sanitize_html_tags runs on every streamed edit
+_MALFORMED_TAG_RE = re.compile(r'<([a-zA-Z]+)[^>]*</')
+_DISALLOWED_TAG_RE = re.compile(f'<(?!/?)(?!(?:{_ALLOWED_TAGS_PATTERN})\b)[^>]*>')
+_CLOSING_TAG_RE = re.compile(r'</([a-zA-Z]+)')
+_OPENING_TAG_RE = re.compile(r'<([a-zA-Z]+)')
+_HREF_RE = re.compile(r'href=["\'](.*?)["\']')
+_ANY_TAG_RE = re.compile(r'<[^>]*>')
+
 def sanitize_html_tags(text: str) -> str:
     """
     Simplified HTML sanitizer that ensures all tags are properly closed.
@@ -9,16 +22,17 @@ def sanitize_html_tags(text: str) -> str:
     """
     if not text or not text.strip():
         return "Processing..."  # Return placeholder for empty content
+
+    if '<' not in text:
+        # No tags at all: only the final whitespace cleanup below would change anything
+        return text.replace('  ', ' ').strip()
         
     try:
         # Strip any existing malformed or nested tags first
-        text = re.sub(r'<([a-zA-Z]+)[^>]*</', '</', text)
-        
-        # Define allowed tags
-        allowed_tags = '|'.join(['b', 'i', 'u', 's', 'code', 'pre', 'a'])
+        text = _MALFORMED_TAG_RE.sub('</', text)
         
         # Remove any tags that aren't in our allowed list
-        text = re.sub(f'<(?!/?)(?!(?:{allowed_tags})\b)[^>]*>', '', text)
+        text = _DISALLOWED_TAG_RE.sub('', text)
         
         # Process the text character by character
         result = []
@@ -39,25 +53,27 @@ def sanitize_html_tags(text: str) -> str:
                     
                     # Check if it's a closing tag
                     if tag_str.startswith('</'):
-                        tag_name = re.match(r'</([a-zA-Z]+)', tag_str)
-                        if tag_name and tag_name.group(1).lower() in allowed_tags.split('|'):
-                            if tag_stack and tag_stack[-1] == tag_name.group(1).lower():
+                        tag_match = _CLOSING_TAG_RE.match(tag_str)
+                        tag_name = tag_match.group(1).lower() if tag_match else None
+                        if tag_name in ALLOWED_TAGS:
+                            if tag_stack and tag_stack[-1] == tag_name:
                                 result.append(tag_str)
                                 tag_stack.pop()
                     
                     # Check if it's an opening tag
                     else:
-                        tag_name = re.match(r'<([a-zA-Z]+)', tag_str)
-                        if tag_name and tag_name.group(1).lower() in allowed_tags.split('|'):
-                            if tag_name.group(1).lower() == 'a':
+                        tag_match = _OPENING_TAG_RE.match(tag_str)
+                        tag_name = tag_match.group(1).lower() if tag_match else None
+                        if tag_name in ALLOWED_TAGS:
+                            if tag_name == 'a':
                                 # Special handling for <a> tags with href
-                                href_match = re.search(r'href=["\'](.*?)["\']', tag_str)
+                                href_match = _HREF_RE.search(tag_str)
                                 if href_match:
                                     result.append(f'<a href="{href_match.group(1)}">')
                                     tag_stack.append('a')
                             else:
-                                result.append(f'<{tag_name.group(1).lower()}>')
-                                tag_stack.append(tag_name.group(1).lower())
+                                result.append(f'<{tag_name}>')
+                                tag_stack.append(tag_name)
                     
                     in_tag = False
                     current_tag = []
@@ -83,4 +99,4 @@ def sanitize_html_tags(text: str) -> str:
     except Exception as e:
         logging.error(f"Sanitization error: {e}")
         # If anything goes wrong, strip all HTML tags
-        return re.sub(r'<[^>]*>', '', text)
+        return _ANY_TAG_RE.sub('', text)
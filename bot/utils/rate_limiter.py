@@ -1,30 +1,62 @@
-from datetime import datetime, timedelta
 import logging
 from typing import Optional
 import asyncio
+import time
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import Message
 import re
 
+_TAG_RE = re.compile(r'<[^>]+>')
+MAX_UPDATE_INTERVAL = 5.0  # Upper bound for the edit interval once a flood ban has passed
+MAX_FLOOD_WAITS = 5  # retry_after waits the final update sits out before giving up
+
 class MessageRateLimiter:
+    # Built once per streamed reply, so skip the per-instance __dict__
+    __slots__ = ("base_interval", "update_interval", "min_chunk_size", "last_update_time",
+                 "current_length", "blocked_until")
+
     def __init__(self, update_interval: float = 0.3, min_chunk_size: int = 150):
-        self.update_interval = timedelta(seconds=update_interval)
+        self.base_interval = update_interval
+        self.update_interval = update_interval
         self.min_chunk_size = min_chunk_size
-        self.last_update_time = datetime.min
-        self.current_message = None
+        self.last_update_time = float('-inf')  # time.monotonic() of the last edit
+        self.current_length = None  # Length of the text last pushed to Telegram
+        self.blocked_until = float('-inf')  # time.monotonic() before which Telegram refuses edits
 
-    async def should_update_message(self, new_content: str) -> bool:
-        current_time = datetime.now()
-        content_length = len(new_content)
-        current_length = len(self.current_message or "")
+    def should_update_message(self, content_length: int) -> bool:
+        """Called for every streamed chunk, so kept synchronous to avoid a coroutine per chunk"""
+        if self.current_length is not None and content_length < self.current_length + self.min_chunk_size:
+            return False  # Cheap size check first; most chunks stop here without reading the clock
 
-        if (self.current_message is None or
-            (content_length >= current_length + self.min_chunk_size and 
-             current_time - self.last_update_time >= self.update_interval)):
+        current_time = time.monotonic()
+        if current_time < self.blocked_until:
+            return False  # Still inside a flood-control ban
+        if (self.current_length is None or
+            current_time - self.last_update_time >= self.update_interval):
             self.last_update_time = current_time
-            self.current_message = new_content
+            self.current_length = content_length
             return True
         return False
 
+    def restart(self) -> None:
+        """Pace a new message from scratch; a flood ban Telegram set stays in force"""
+        self.last_update_time = float('-inf')
+        self.current_length = None
+
+    def back_off(self, retry_after: float) -> None:
+        """Hold edits for the retry_after Telegram sent, then space them out more"""
+        self.blocked_until = time.monotonic() + retry_after
+        self.update_interval = min(MAX_UPDATE_INTERVAL, self.update_interval * 2)
+
+    def blocked_for(self) -> float:
+        """Seconds left in the current flood-control ban"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def record_success(self) -> None:
+        """Decay the edit interval back toward its base after a successful edit"""
+        if self.update_interval > self.base_interval:
+            self.update_interval = max(self.base_interval, self.update_interval / 2)
+
     @staticmethod
     async def retry_final_update(message: Message, content: str, 
                                max_retries: int = 3, initial_delay: float = 0.3) -> None:
@@ -35,21 +67,36 @@ class MessageRateLimiter:
             return
         
         # Ensure content is not just HTML tags
-        stripped_content = re.sub(r'<[^>]+>', '', content).strip()
+        stripped_content = _TAG_RE.sub('', content).strip()
         if not stripped_content:
             logging.info("Skipping update: Content contains only HTML tags")
             return
 
         retry_delay = initial_delay
-        for attempt in range(max_retries):
+        attempt = 0
+        flood_waits = 0
+        while attempt < max_retries:
+            attempt += 1
             try:
                 # Ensure we're sending valid content
                 if len(content.strip()) > 0:
                     await message.edit_text(content, parse_mode="HTML")
-                    logging.info(f"Final message update succeeded on attempt {attempt + 1}")
+                    logging.info("Final message update succeeded on attempt %d", attempt)
                 else:
                     logging.info("Skipping update: Empty content after processing")
                 break
+
+            except TelegramRetryAfter as e:
+                # This edit carries the whole answer, so wait out the full ban
+                # Telegram asks for; sitting it out doesn't use up an attempt
+                if flood_waits < MAX_FLOOD_WAITS:
+                    flood_waits += 1
+                    attempt -= 1
+                    logging.warning("Flood control encountered. Retrying in %s seconds...", e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                logging.warning("Final message update error: %s", e)
+                break
             
             except Exception as e:
                 error_text = str(e).lower()
@@ -58,8 +105,8 @@ class MessageRateLimiter:
                     logging.info("Skipping update: Telegram reports empty message")
                     break
                 elif "flood control" in error_text:
-                    if attempt < max_retries - 1:
-                        logging.warning(f"Flood control encountered. Retrying in {retry_delay} seconds...")
+                    if attempt < max_retries:
+                        logging.warning("Flood control encountered. Retrying in %s seconds...", retry_delay)
                         await asyncio.sleep(retry_delay)
                         retry_delay *= 1.1
                         continue
@@ -67,5 +114,5 @@ class MessageRateLimiter:
                     logging.debug("Message content unchanged")
                     break
                 else:
-                    logging.warning(f"Final message update error: {e}")
+                    logging.warning("Final message update error: %s", e)
                 break
\ No newline at end of file
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from .message_sanitizer import sanitize_html_tags
+from .rate_limiter import MessageRateLimiter
+
+class StreamedMessage:
+    """Edit state of the Telegram message a reply is currently streamed into"""
+    __slots__ = ("message", "parts", "length", "rate_limiter",
+                 "edit_task", "sent_length", "last_sent_text")
+
+    def __init__(self, message: Message, update_interval: float = 0.5):
+        # One limiter per reply, so a flood ban carries over into continuation messages
+        self.rate_limiter = MessageRateLimiter(update_interval=update_interval)
+        self.reset(message)
+
+    def reset(self, message: Message) -> None:
+        """Start streaming into a new Telegram message"""
+        self.message = message
+        # Chunks are collected in a list and joined only when an edit is due
+        self.parts: List[str] = []
+        self.length = 0
+        self.rate_limiter.restart()
+        self.edit_task: Optional[asyncio.Task] = None  # In-flight edit; the stream keeps being read while it runs
+        self.sent_length: Optional[int] = None  # Length of the last edit Telegram actually accepted
+        self.last_sent_text: Optional[str] = None  # Sanitized text of the last edit sent to Telegram
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+    def append(self, chunk: str) -> None:
+        self.parts.append(chunk)
+        self.length += len(chunk)
+
+    def split(self, limit: int) -> Tuple[str, str]:
+        """Cut the text at the last line break before limit"""
+        text = self.text
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        return text[:cut], text[cut:]
+
+    def maybe_edit(self) -> None:
+        """Start a background edit if one is due and none is in flight"""
+        if self.edit_task is not None:
+            if not self.edit_task.done():
+                return  # Coalesce: the next edit after this one carries the latest text
+            self.sent_length = self.edit_task.result() or self.sent_length
+            self.edit_task = None
+        # Sanitize only when an edit is actually due, not on every chunk
+        if not self.rate_limiter.should_update_message(self.length):
+            return
+        text = sanitize_html_tags(self.text)
+        if text == self.last_sent_text:
+            return  # New chunks were only stripped markup; an edit would be a no-op round-trip
+        self.last_sent_text = text
+        self.edit_task = asyncio.create_task(self._push_edit(text, self.length))
+
+    async def _push_edit(self, text: str, length: int) -> Optional[int]:
+        """Edit the message; returns the pushed length if Telegram accepted it"""
+        try:
+            await self.message.edit_text(text, parse_mode="HTML")
+            self.rate_limiter.record_success()
+            return length
+        except TelegramRetryAfter as e:
+            # Skip this edit and space out the next ones instead of thrashing
+            self.rate_limiter.back_off(e.retry_after)
+            logging.warning("Flood control on message update, retry after %ss", e.retry_after)
+        except Exception as e:
+            if "message is not modified" not in str(e).lower():
+                logging.warning("Message update error: %s", e)
+        return None
+
+    async def settle(self) -> None:
+        """Wait for the in-flight edit so a stale one never lands after the final text"""
+        if self.edit_task is not None:
+            self.sent_length = await self.edit_task or self.sent_length
+            self.edit_task = None
+
+    def is_complete(self) -> bool:
+        """Whether the last accepted edit already showed all of the text"""
+        return self.sent_length == self.length
+
+    async def finish(self, text: str) -> None:
+        """Push the final text of this message"""
+        await self.settle()
+        # Don't spend an attempt on a flood ban we already know about
+        delay = self.rate_limiter.blocked_for()
+        if delay:
+            await asyncio.sleep(delay)
+        await MessageRateLimiter.retry_final_update(self.message, sanitize_html_tags(text))
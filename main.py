@@ -9,6 +9,8 @@ from aiogram.client.default import DefaultBotProperties
 from bot.config import Config
 from bot.handlers import admin, user
 from bot.services.storage import Storage
+from bot.services.http_client import close_session
+from bot.services.ai_providers import close_providers
 
 async def main():
     logging.basicConfig(
@@ -19,10 +21,8 @@ async def main():
     # Load config
     config = Config.from_env()
     
-    # Debug print config
-    print("\nBot Configuration:")
-    print(f"Admin ID: {config.admin_id}")
-    print(f"Allowed Users: {config.allowed_user_ids}")
+    # Debug log config
+    logging.debug("Bot configuration: admin ID %s, allowed users %s", config.admin_id, sorted(config.allowed_user_ids))
     
     # Initialize storages
     memory_storage = MemoryStorage()  # For FSM
@@ -43,16 +43,19 @@ async def main():
     
     # Register middlewares
     dp.message.middleware(ChatActionMiddleware())
+
+    # Release pooled HTTP connections and write pending usage rows on shutdown
+    dp.shutdown.register(close_session)
+    dp.shutdown.register(close_providers)
+    dp.shutdown.register(user.storage.flush_usage)
     
     # Register routers
     dp.include_router(admin.router)  # Admin router first
     dp.include_router(user.router)   # User router second
     
     # Start polling with debug info
-    print("\n[INFO] Bot is starting...")
-    print("[INFO] Access Control:")
-    print(f"- Admin ID: {config.admin_id}")
-    print(f"- Allowed Users: {len(config.allowed_user_ids)} users")
+    logging.info("Bot is starting...")
+    logging.info("Access control: admin ID %s, %d allowed users", config.admin_id, len(config.allowed_user_ids))
     
     await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Config.from_env() runs when the handler modules are imported
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("ALLOWED_USER_IDS", "1")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("PERPLEXITY_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import asyncio
+
+from bot.utils.streaming import StreamedMessage
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+
+def stream_words(stream: StreamedMessage, lines: int, words_per_line: int = 12) -> None:
+    """Feed the stream the way providers do: word tokens and standalone newline tokens"""
+    for _ in range(lines):
+        for _ in range(words_per_line):
+            stream.append("lorem ")
+        stream.append("\n")
+
+def test_split_cuts_at_streamed_newline_chunks():
+    stream = StreamedMessage(FakeMessage())
+    stream_words(stream, lines=60)
+
+    head, tail = stream.split(4000)
+
+    assert len(head) <= 4000
+    assert head + tail == stream.text
+    assert tail.startswith("\n")  # Cut at a line break, not mid-word
+    assert head.endswith("lorem ")
+
+def test_split_falls_back_to_hard_cut_without_newlines():
+    stream = StreamedMessage(FakeMessage())
+    stream.append("x" * 4500)
+
+    head, tail = stream.split(4000)
+
+    assert len(head) == 4000
+    assert len(tail) == 500
+
+def test_streamed_text_keeps_newlines():
+    async def run():
+        message = FakeMessage()
+        stream = StreamedMessage(message, update_interval=0)
+        stream_words(stream, lines=3)
+        stream.maybe_edit()
+        await stream.settle()
+        return message, stream
+
+    message, stream = asyncio.run(run())
+
+    assert stream.text.count("\n") == 3
+    assert message.edits[-1].count("\n") == 2  # The trailing newline is stripped when sanitized
+
+def test_flood_ban_survives_reset():
+    async def run():
+        stream = StreamedMessage(FakeMessage(), update_interval=0)
+        stream.rate_limiter.back_off(30)
+
+        next_message = FakeMessage()
+        stream.reset(next_message)
+        stream.append("continued reply")
+        stream.maybe_edit()
+        return stream, next_message
+
+    stream, next_message = asyncio.run(run())
+
+    assert stream.rate_limiter.blocked_for() > 29
+    assert stream.edit_task is None
+    assert next_message.edits == []  # No edit while Telegram's retry_after is still running
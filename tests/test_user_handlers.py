@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.handlers import user
+
+class FakeStorage:
+    """Storage whose user row exists but has no provider picked yet"""
+
+    async def get_user_settings(self, user_id):
+        return {'current_provider': None, 'current_model': None}
+
+    async def get_chat_history(self, user_id, limit=10):
+        return []
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.from_user = SimpleNamespace(id=1, username="user", first_name="User")
+        self.text = text
+        self.caption = None
+        self.photo = None
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+class FakeState:
+    def __init__(self):
+        self.state = None
+
+    async def set_state(self, state):
+        self.state = state
+
+def test_chat_message_with_null_provider_asks_to_pick_one(monkeypatch):
+    monkeypatch.setattr(user, "storage", FakeStorage())
+    message, state = FakeMessage("hello"), FakeState()
+
+    asyncio.run(user.process_chat_message(message, state))
+
+    assert message.answers == ["🤖 Please select an AI Model first:"]
+    assert state.state == user.UserStates.choosing_provider
+
+def test_info_with_null_provider_asks_to_pick_one(monkeypatch):
+    monkeypatch.setattr(user, "storage", FakeStorage())
+    message, state = FakeMessage("ℹ️ Info"), FakeState()
+
+    asyncio.run(user.info_button(message, state))
+
+    assert message.answers[0].startswith("ℹ️ No AI provider selected yet.")
+    assert state.state == user.UserStates.choosing_provider
+
+class FakeBotMessage:
+    def __init__(self):
+        self.text = None
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+
+class FakeProvider:
+    async def chat_completion_stream(self, message, model_config, history=None, image=None):
+        for _ in range(80):
+            for _ in range(12):
+                yield "lorem "
+            yield "\n"
+
+class ChattingStorage(FakeStorage):
+    def __init__(self):
+        self.history = []
+
+    async def get_user_settings(self, user_id):
+        return {'current_provider': 'openai', 'current_model': 'gpt'}
+
+    async def add_to_history(self, user_id, content, is_bot, image_data=None):
+        self.history.append(content)
+
+    async def log_usage(self, **kwargs):
+        pass
+
+def test_long_reply_splits_at_streamed_newlines(monkeypatch):
+    storage = ChattingStorage()
+    monkeypatch.setattr(user, "storage", storage)
+    monkeypatch.setattr(user, "get_provider", lambda name, config: FakeProvider())
+    sent = []
+
+    class ChatMessage(FakeMessage):
+        async def answer(self, text, **kwargs):
+            self.answers.append(text)
+            sent.append(FakeBotMessage())
+            return sent[-1]
+
+    message = ChatMessage("hello")
+    asyncio.run(user.process_chat_message(message, FakeState()))
+
+    assert len(sent) == 2
+    assert sent[0].text.endswith("lorem")  # Finished at a line break, not mid-word
+    assert storage.history[-1].count("\n") == 80  # Streamed newline chunks reach the stored reply